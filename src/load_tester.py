@@ -1,19 +1,83 @@
 import argparse
 import asyncio
 import aiohttp
+import orjson
 import time
 import json
-from collections import defaultdict
-from statistics import mean, median, stdev
-import matplotlib.pyplot as plt
 import io
 import os
-import glob
 import numpy as np
-from scipy.stats import gaussian_kde
 from request_patterns import constant_rate_requests, spike_requests, ramp_requests
 
 
+# Request patterns selectable with --pattern.
+REQUEST_PATTERNS = {
+    'constant': constant_rate_requests,
+    'spike': spike_requests,
+    'ramp': ramp_requests
+}
+
+def uvloop_policy():
+    """Returns a uvloop event loop policy, importing uvloop only when it is selected."""
+    import uvloop
+    return uvloop.EventLoopPolicy()
+
+# Event loop implementations selectable with --loop.
+EVENT_LOOP_POLICIES = {
+    'uvloop': uvloop_policy,
+    'asyncio': asyncio.DefaultEventLoopPolicy
+}
+
+# Largest latency, in microseconds, the int32 latency column can hold (about 2147s).
+MAX_LATENCY_US = int(np.iinfo(np.int32).max)
+
+def hist_bucket(us):
+    """
+    Maps a latency to its bucket in the log-linear latency histogram. Latencies below 128us get
+    one bucket per microsecond; above that every power of two is split into 64 buckets, so the
+    bucket width is always within 1/64 of the value.
+
+    Args:
+        us (int): Latency in microseconds.
+
+    Returns:
+        int: Index of the histogram bucket.
+    """
+    if us < 128:
+        return us
+    shift = us.bit_length() - 7
+    return 64 * shift + (us >> shift)
+
+def hist_bucket_upper(index):
+    """
+    Returns the exclusive upper bound, in microseconds, of a latency histogram bucket.
+
+    Args:
+        index (int): Index of the histogram bucket.
+
+    Returns:
+        int: Smallest latency in microseconds that falls into a later bucket.
+    """
+    if index < 128:
+        return index + 1
+    shift = index // 64 - 1
+    return (index - 64 * shift + 1) << shift
+
+def next_file_number(directory):
+    """
+    Returns the number to give the next plot file in a directory: the count of its visible
+    entries, as glob('*') would list them, using a single directory scan.
+
+    Args:
+        directory (str): Directory the plot is saved to.
+
+    Returns:
+        int: Number of non-hidden entries in the directory.
+    """
+    with os.scandir(directory) as entries:
+        return sum(1 for entry in entries if not entry.name.startswith('.'))
+
+
 class HTTPLoadTestError(Exception):
     """
     Custom exception class for handling specific HTTP load test errors.
@@ -33,11 +97,17 @@ class HTTPLoadTester:
         headers (dict): HTTP headers for requests.
         payload (dict): Payload for POST requests, if any.
         timeout (int): Timeout for each request.
-        results (defaultdict): Stores response times categorized by HTTP status codes.
         errors (int): Number of request errors encountered during the test.
         total_requests (int): Total number of requests made during the test.
-        latencies (list): List of latency times for each request.
-        start_time (float): Start time of the test.
+        latencies (numpy.ndarray): Latency in seconds of each answered request.
+        start_time_ns (int): Start time of the test, in nanoseconds on the monotonic clock.
+        end_time (float): End time of the test, in seconds on the monotonic clock.
+
+    Per-request samples are stored column-wise in preallocated NumPy arrays: `_ts` holds the send
+    time relative to the start of the test in nanoseconds (int64), `_lat_us` the latency in
+    microseconds (int32) and `_status` the HTTP status code (0 when no response was received).
+    Only the first `_n` entries are valid. Latencies of answered requests are also counted in the
+    `_hist` histogram (see `hist_bucket`), which the percentiles are read from.
     """
     def __init__(self, config):
         self.url = config.get('url')  # URL to test.
@@ -46,23 +116,113 @@ class HTTPLoadTester:
         self.duration = config.get('duration', 60)  # Duration of the test in seconds.
         self.headers = config.get('headers', {})  # HTTP headers for requests.
         self.payload = config.get('payload', None)  # Payload for POST requests.
+        self._payload_bytes = None  # Payload serialized once, for every POST request.
+        if self.payload:
+            try:
+                self._payload_bytes = orjson.dumps(self.payload)
+            except TypeError:
+                # orjson rejects integers beyond 64 bits, which json.loads accepts.
+                self._payload_bytes = json.dumps(self.payload).encode()
+        self._post_headers = dict(self.headers)  # Headers for POST requests with a JSON body.
+        if not any(name.lower() == 'content-type' for name in self._post_headers):
+            self._post_headers['Content-Type'] = 'application/json'
         self.timeout = config.get('timeout', 30)  # Timeout for each request.
-        self.results = defaultdict(list)  # Store results by status code.
+        self._timeout = aiohttp.ClientTimeout(total=self.timeout)  # Shared timeout for the session.
         self.errors = 0  # Count of errors during test.
         self.total_requests = 0  # Total number of requests made.
-        self.latencies = []  # List of latency times.
-        self.start_time = None  # Start time of the test.
-        self.pattern_functions = {
-            'constant': constant_rate_requests,
-            'spike': spike_requests,
-            'ramp': ramp_requests
-        }
-        self.pattern = config.get('pattern', 'constant')
+        self.start_time_ns = None  # Start time of the test.
+        self.pattern = config.get('pattern', 'constant')  # Request pattern.
+        if self.pattern not in REQUEST_PATTERNS:
+            raise HTTPLoadTestError(f"Unknown request pattern: {self.pattern}")
+        self._pattern_fn = REQUEST_PATTERNS[self.pattern]  # Resolved once at construction.
         self.end_time = None
-        self.request_times = []
+        cap = int(self.qps * self.duration * 2) + 1024  # Estimated number of requests, with headroom.
+        self._ts = np.empty(cap, dtype=np.int64)  # Send time of each request.
+        self._lat_us = np.empty(cap, dtype=np.int32)  # Latency of each request.
+        self._status = np.empty(cap, dtype=np.uint16)  # Status code of each request.
+        self._n = 0  # Number of recorded requests.
+        # Sized for any latency the int32 column can hold, independent of the timeout.
+        self._hist = np.zeros(hist_bucket(MAX_LATENCY_US) + 1, dtype=np.uint32)  # Latency histogram.
+        self._inflight = set()  # Worker tasks that have not finished yet.
+        # Send a POST request if a payload is present, a GET request otherwise.
+        self._do_request = self._do_post if self.payload else self._do_get
+
+    async def generate_requests(self, queue):
+        await self._pattern_fn(self, queue)
+
+    @property
+    def latencies(self):
+        """Latency in seconds of each answered request, read from the sample arrays."""
+        return self._lat_us[:self._n][self._status[:self._n] != 0] * 1e-6
+
+    def _spawn(self, coro):
+        """
+        Schedules a coroutine as a task and tracks it until it finishes.
+
+        Args:
+            coro (coroutine): The coroutine to run.
+
+        Returns:
+            asyncio.Task: The scheduled task.
+        """
+        task = asyncio.create_task(coro)
+        self._inflight.add(task)
+        task.add_done_callback(self._inflight.discard)
+        return task
+
+    def _reserve(self):
+        """
+        Claims the next slot in the sample arrays, doubling their capacity if it is exhausted.
+
+        Returns:
+            int: Index of the claimed slot.
+        """
+        i = self._n
+        if i == self._ts.size:
+            cap = 2 * i
+            self._ts = np.resize(self._ts, cap)
+            self._lat_us = np.resize(self._lat_us, cap)
+            self._status = np.resize(self._status, cap)
+        self._n = i + 1
+        return i
 
-    async def generate_requests(self, session):
-        await self.pattern_functions[self.pattern](self, session)
+    async def _do_get(self, session):
+        """
+        Sends a GET request and drains the response body.
+
+        Args:
+            session (aiohttp.ClientSession): The session used to send the request.
+
+        Returns:
+            int: HTTP status code of the response.
+        """
+        response = await session.get(self.url, headers=self.headers)
+        try:
+            # Drain the body chunk by chunk, without joining or decoding it.
+            while await response.content.readany():
+                pass
+        finally:
+            response.release()
+        return response.status
+
+    async def _do_post(self, session):
+        """
+        Sends a POST request with the serialized payload and drains the response body.
+
+        Args:
+            session (aiohttp.ClientSession): The session used to send the request.
+
+        Returns:
+            int: HTTP status code of the response.
+        """
+        response = await session.post(self.url, data=self._payload_bytes, headers=self._post_headers)
+        try:
+            # Drain the body chunk by chunk, without joining or decoding it.
+            while await response.content.readany():
+                pass
+        finally:
+            response.release()
+        return response.status
 
     async def make_request(self, session):
         """
@@ -70,47 +230,120 @@ class HTTPLoadTester:
         
         Args:
             session (aiohttp.ClientSession): The session used to send the request.
-            
-        Raises:
-            HTTPLoadTestError: If a timeout occurs during the request.
+
+        Returns:
+            bool: True if a response was received, False if the request failed or timed out.
         """
-        start_time = time.time()
-        self.request_times.append(start_time - self.start_time)  # Record the time of the request
+        start_ns = time.monotonic_ns()
+        i = self._reserve()
+        self._ts[i] = start_ns - self.start_time_ns  # Record the time of the request
+        self._status[i] = 0  # No response yet.
         try:
-            if self.payload:
-                # Send a POST request if a payload is present.
-                async with session.post(self.url, json=self.payload, headers=self.headers, timeout=self.timeout) as response:
-                    data = await response.json()  # Awaiting response data.
-                    latency = time.time() - start_time
-                    self.results[response.status].append(latency)
-                    self.latencies.append((time.time() - self.start_time, latency))
-                    # print("Received Data from Server: ", data)
-            else:
-                # Send a GET request if no payload is specified.
-                async with session.get(self.url, headers=self.headers, timeout=self.timeout) as response:
-                    await response.text()  # Awaiting response text.
-                    latency = time.time() - start_time
-                    self.results[response.status].append(latency)
-                    self.latencies.append((time.time() - self.start_time, latency))
+            status = await self._do_request(session)
+            end_ns = time.monotonic_ns()
+            # Clamped so a request slower than ~2147s (possible with the timeout disabled) can't wrap.
+            latency_us = min((end_ns - start_ns) // 1000, MAX_LATENCY_US)
+            self._lat_us[i] = latency_us
+            self._status[i] = status
+            self._hist[hist_bucket(latency_us)] += 1
         except asyncio.TimeoutError:
-            self.errors += 1
-            raise HTTPLoadTestError(f"Request to {self.url} timed out.")
+            print(f"Error: Request to {self.url} timed out.")
+            return False
         except Exception as e:
-            self.errors += 1
             print(f"Error: {str(e)}")
+            return False
+        return True
+
+    async def _worker(self, session, queue):
+        """
+        Long-lived worker that sends one request per deadline taken off the queue, waiting until
+        each deadline is due. Stops when it receives None. Request and error counts are kept locally
+        and added to the tester's totals once, when the worker exits.
+
+        Args:
+            session (aiohttp.ClientSession): The session used to send requests.
+            queue (asyncio.Queue): Queue of request deadlines on the time.monotonic clock.
+        """
+        clock = time.monotonic
+        local_total = 0
+        local_errors = 0
+        try:
+            while True:
+                deadline = await queue.get()
+                if deadline is None:
+                    break
+                delay = deadline - clock()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if not await self.make_request(session):
+                    local_errors += 1
+                local_total += 1
         finally:
-            self.total_requests += 1
+            self.total_requests += local_total
+            self.errors += local_errors
+
+    async def warm_up(self, session):
+        """
+        Opens up to `concurrency` pooled connections with HEAD requests before the test starts,
+        so the first requests of the run don't pay the TCP/TLS handshake cost.
+
+        Args:
+            session (aiohttp.ClientSession): The session whose connection pool is warmed up.
+        """
+        async def head():
+            try:
+                async with session.head(self.url, headers=self.headers) as response:
+                    await response.read()
+            except Exception:
+                pass  # Warm-up failures are not part of the measured results.
+
+        await asyncio.gather(*(head() for _ in range(self.concurrency)))
 
     async def run_test(self):
         """
         Manages the entire load test by orchestrating the sending of HTTP requests according
         to the specified configuration (QPS, concurrency, etc.), and timing their execution.
         """
-        async with aiohttp.ClientSession() as session:
-            self.start_time = time.time()
-            self.end_time = self.start_time + self.duration
-            await self.generate_requests(session)
-        await asyncio.gather(*asyncio.all_tasks() - {asyncio.current_task()})
+        # One pooled session for the whole run so TCP/TLS handshakes and DNS lookups are amortized.
+        connector = aiohttp.TCPConnector(
+            limit=0,
+            limit_per_host=max(self.concurrency * 4, 1024),
+            ttl_dns_cache=300,
+            enable_cleanup_closed=True
+        )
+        async with aiohttp.ClientSession(connector=connector, timeout=self._timeout, read_bufsize=4 << 20) as session:
+            await self.warm_up(session)
+            self.start_time_ns = time.monotonic_ns()
+            self.end_time = self.start_time_ns * 1e-9 + self.duration
+            # A fixed pool of `concurrency` workers sends the requests; the bounded queue keeps
+            # the request pattern only a few deadlines ahead of them.
+            queue = asyncio.Queue(maxsize=self.concurrency)
+            for _ in range(self.concurrency):
+                self._spawn(self._worker(session, queue))
+            await self.generate_requests(queue)
+            for _ in range(self.concurrency):
+                await queue.put(None)  # One stop signal per worker.
+            # Requests still in flight must finish before the session is closed.
+            await asyncio.gather(*self._inflight)
+
+    def percentiles(self, quantiles, max_latency=None):
+        """
+        Reads latency percentiles off the latency histogram with a single cumulative scan.
+
+        Args:
+            quantiles (list): Quantiles to compute, each between 0 and 1.
+            max_latency (float): Observed maximum latency in seconds, used to cap the results.
+                Defaults to the upper bound of the highest non-empty bucket.
+
+        Returns:
+            list: Latency in seconds for each quantile, accurate to the histogram bucket width.
+        """
+        cdf = np.cumsum(self._hist)
+        ranks = np.maximum(np.ceil(cdf[-1] * np.asarray(quantiles)), 1)
+        indices = np.searchsorted(cdf, ranks)
+        if max_latency is None:
+            max_latency = hist_bucket_upper(int(np.flatnonzero(self._hist)[-1])) * 1e-6
+        return [min(hist_bucket_upper(int(index)) * 1e-6, max_latency) for index in indices]
 
     def print_results(self):
         """
@@ -123,21 +356,25 @@ class HTTPLoadTester:
         print(f"Error Rate: {self.errors / self.total_requests:.2%}")
         print(f"Actual QPS: {self.total_requests / self.duration:.2f}")
 
-        all_latencies = [latency for latencies in self.results.values() for latency in latencies]
-        if all_latencies:
+        all_latencies = self.latencies
+        if all_latencies.size:
+            max_latency = all_latencies.max()
+            median, p90, p95, p99 = self.percentiles([0.5, 0.9, 0.95, 0.99], max_latency)
+            std_dev = all_latencies.std(ddof=1) if all_latencies.size > 1 else 0.0
             print(f"\nLatency Statistics (seconds):")
-            print(f"  Min: {min(all_latencies):.4f}")
-            print(f"  Max: {max(all_latencies):.4f}")
-            print(f"  Mean: {mean(all_latencies):.4f}")
-            print(f"  Median: {median(all_latencies):.4f}")
-            print(f"  P90: {sorted(all_latencies)[int(len(all_latencies)*0.9)]:.4f}")
-            print(f"  P95: {sorted(all_latencies)[int(len(all_latencies)*0.95)]:.4f}")
-            print(f"  P99: {sorted(all_latencies)[int(len(all_latencies)*0.99)]:.4f}")
-            print(f"  Std Dev: {stdev(all_latencies):.4f}")
+            print(f"  Min: {all_latencies.min():.4f}")
+            print(f"  Max: {max_latency:.4f}")
+            print(f"  Mean: {all_latencies.mean():.4f}")
+            print(f"  Median: {median:.4f}")
+            print(f"  P90: {p90:.4f}")
+            print(f"  P95: {p95:.4f}")
+            print(f"  P99: {p99:.4f}")
+            print(f"  Std Dev: {std_dev:.4f}")
 
         print("\nStatus Code Distribution:")
-        for status, latencies in self.results.items():
-            print(f"  {status}: {len(latencies)}")
+        counts = np.bincount(self._status[:self._n], minlength=1)
+        for status in np.flatnonzero(counts[1:]) + 1:
+            print(f"  {status}: {counts[status]}")
 
         self.plot_latencies()
         self.plot_request_pattern()
@@ -147,7 +384,15 @@ class HTTPLoadTester:
         Generates and saves a plot of latencies over time to a PNG file. Each plot file is
         uniquely named based on the number of existing files in the 'Latency_Plots' directory.
         """
-        times, latencies = zip(*self.latencies)
+        import matplotlib
+        matplotlib.use('Agg')  # Render to files only; no GUI backend is needed.
+        import matplotlib.pyplot as plt
+
+        answered = self._status[:self._n] != 0
+        latencies = self._lat_us[:self._n][answered] * 1e-6
+        times = self._ts[:self._n][answered] * 1e-9 + latencies  # Completion time of each request.
+        order = np.argsort(times, kind='stable')
+        times, latencies = times[order], latencies[order]
         plt.figure(figsize=(10, 5))
         plt.plot(times, latencies)
         plt.title('Latency over time')
@@ -157,9 +402,10 @@ class HTTPLoadTester:
         
         buf = io.BytesIO()
         plt.savefig(buf, format='png')
+        plt.close()
         buf.seek(0)
 
-        file_number = len(glob.glob('/app/Latency_Plots/*'))
+        file_number = next_file_number('/app/Latency_Plots')
         print("\nLatency plot saved as '/app/Latency_Plots/latency_plot" + str(file_number) + ".png'")
         with open('/app/Latency_Plots/latency_plot' + str(file_number) + '.png', 'wb') as f:
             f.write(buf.getvalue())
@@ -169,15 +415,21 @@ class HTTPLoadTester:
         Generates and saves a plot of the request pattern over time to a PNG file.
         Each plot file is uniquely named based on the number of existing files in the 'Pattern_Plots' directory.
         """
+        import matplotlib
+        matplotlib.use('Agg')  # Render to files only; no GUI backend is needed.
+        import matplotlib.pyplot as plt
+
         plt.figure(figsize=(10, 5))
         
-        # Calculate the density using a Gaussian Kernel Density Estimation
-        density = gaussian_kde(self.request_times)
-        xs = np.linspace(0, self.duration, 200)  # 200 points for smoothness
-        density.covariance_factor = lambda : .25  # Smaller bandwidth for more detail
-        density._compute_covariance()
-        
-        plt.plot(xs, density(xs), label='Request Density')
+        # Calculate the density as a histogram of send times smoothed with a Hann window
+        bins = max(200, int(self.duration * 10))  # At least 200 bins for smoothness
+        counts, edges = np.histogram(self._ts[:self._n] * 1e-9, bins=bins, range=(0, self.duration), density=True)
+        kernel = np.hanning(11)
+        kernel /= kernel.sum()
+        density = np.convolve(counts, kernel, mode='same')
+        xs = (edges[:-1] + edges[1:]) / 2
+
+        plt.plot(xs, density, label='Request Density')
         plt.title(f'Request Pattern over Time ({self.pattern})')
         plt.xlabel('Time (s)')
         plt.ylabel('Density')
@@ -186,9 +438,10 @@ class HTTPLoadTester:
         
         buf = io.BytesIO()
         plt.savefig(buf, format='png')
+        plt.close()
         buf.seek(0)
         
-        file_number = len(glob.glob('/app/Pattern_Plots/*'))
+        file_number = next_file_number('/app/Pattern_Plots')
         print(f"\nRequest pattern plot saved as '/app/Pattern_Plots/pattern_plot{file_number}.png'")
         with open(f'/app/Pattern_Plots/pattern_plot{file_number}.png', 'wb') as f:
             f.write(buf.getvalue())
@@ -202,8 +455,10 @@ def main():
     parser.add_argument("--headers", type=json.loads, default="{}", help="Headers as JSON string")
     parser.add_argument("--payload", type=json.loads, help="POST request payload as JSON string")
     parser.add_argument("--timeout", type=int, default=30, help="Request timeout in seconds")
-    parser.add_argument("--pattern", type=str, default="constant", choices=["constant", "spike", "ramp"],
+    parser.add_argument("--pattern", type=str, default="constant", choices=list(REQUEST_PATTERNS),
                     help="Request pattern: constant, spike, or ramp")
+    parser.add_argument("--loop", type=str, default="uvloop", choices=list(EVENT_LOOP_POLICIES),
+                    help="Event loop implementation: uvloop or asyncio")
     args = parser.parse_args()
     os.makedirs("/app/Latency_Plots", exist_ok=True)
     os.makedirs("/app/Pattern_Plots", exist_ok=True)
@@ -220,6 +475,7 @@ def main():
     }
 
     load_tester = HTTPLoadTester(config)
+    asyncio.set_event_loop_policy(EVENT_LOOP_POLICIES[args.loop]())
     asyncio.run(load_tester.run_test())
     load_tester.print_results()
 
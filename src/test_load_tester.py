@@ -1,6 +1,11 @@
 import pytest
 import asyncio
-from load_tester import HTTPLoadTester  # Import the custom load tester class.
+import math
+import numpy as np
+import time
+from types import SimpleNamespace
+from request_patterns import constant_rate_requests, spike_requests, ramp_requests
+from load_tester import HTTPLoadTester, HTTPLoadTestError, MAX_LATENCY_US, hist_bucket, hist_bucket_upper  # Import the custom load tester class.
 
 def test_initialization():
     """
@@ -22,6 +27,48 @@ def test_initialization():
     assert tester.duration == 60
     assert tester.timeout == 30
 
+@pytest.mark.parametrize('timeout', [0, -1, 2147, 5000])  # 0 or less disables the request timeout.
+def test_timeout_too_large(timeout, monkeypatch):
+    """
+    Test that latencies beyond what int32 microseconds can hold are clamped instead of wrapping negative,
+    for timeouts that are disabled or larger than ~2147s.
+    """
+    tester = HTTPLoadTester({'url': 'https://test.k6.io/contacts.php', 'timeout': timeout})
+    tester.start_time_ns = 0
+
+    async def do_request(session):
+        return 200
+
+    tester._do_request = do_request  # Stub the HTTP request.
+    clock = iter([0, 3_000 * 1_000_000_000])  # The request takes 3000s.
+    monkeypatch.setattr(time, 'monotonic_ns', lambda: next(clock))
+    assert asyncio.run(tester.make_request(None))
+    assert tester._lat_us[0] == MAX_LATENCY_US
+    assert tester.latencies[0] > 2147
+    assert tester.percentiles([0.5])[0] > 2147
+
+def test_payload_beyond_64_bits():
+    """
+    Test that a JSON payload with an integer beyond 64 bits is still serialized.
+    """
+    config = {
+        'url': 'https://httpbin.org/post',
+        'payload': {"key": 2 ** 70}  # Too large for orjson.
+    }
+    tester = HTTPLoadTester(config)
+    assert tester._payload_bytes == b'{"key": 1180591620717411303424}'
+
+def test_unknown_pattern():
+    """
+    Test that HTTPLoadTester rejects an unknown request pattern at construction time.
+    """
+    config = {
+        'url': 'https://test.k6.io/contacts.php',
+        'pattern': 'sawtooth'  # Not one of the supported patterns.
+    }
+    with pytest.raises(HTTPLoadTestError):
+        HTTPLoadTester(config)
+
 def test_get_request_handling():
     """
     Test how HTTPLoadTester handles a basic GET request.
@@ -61,3 +108,123 @@ async def test_post_request_handling():
     assert len(tester.latencies) == 1, "Should record exactly one latency"
     assert tester.total_requests == 1, "Should have made exactly one request"
     assert tester.errors == 0, "Should have no errors"
+
+def test_latency_histogram_buckets():
+    """
+    Test the log-linear bucketing of the latency histogram.
+    This test verifies that every latency falls inside its bucket and that buckets stay within 1/64 of the value.
+    """
+    previous = -1
+    for us in list(range(0, 2048)) + [10_000, 123_456, 1_000_000, 30_000_000]:
+        index = hist_bucket(us)
+        assert index >= previous, "Buckets should be monotonic in latency"
+        assert us < hist_bucket_upper(index), "Latency should be below its bucket's upper bound"
+        assert index == 0 or us >= hist_bucket_upper(index - 1), "Latency should not fit an earlier bucket"
+        assert hist_bucket_upper(index) - us <= max(1, us / 64 + 1)
+        previous = index
+
+@pytest.mark.parametrize('timeout', [30, 0])  # 0 disables the request timeout.
+def test_percentiles_from_histogram(timeout):
+    """
+    Test the percentile readout of the latency histogram against exact ranks.
+    This test verifies that each reported percentile is at least the exact value, at most 1/64 above it, and capped at the maximum.
+    The histogram must not depend on the timeout, so a disabled timeout gives the same results.
+    """
+    tester = HTTPLoadTester({'url': 'http://localhost', 'timeout': timeout})
+    latencies_us = (np.arange(1, 20001, dtype=np.int64) * 7919) % 3_000_000 + 1  # Spread over 1us..3s.
+    tester._lat_us = latencies_us.astype(np.int32)
+    tester._status = np.full(latencies_us.size, 200, dtype=np.uint16)
+    tester._n = latencies_us.size
+    for us in latencies_us:
+        tester._hist[hist_bucket(int(us))] += 1
+
+    quantiles = [0.01, 0.5, 0.9, 0.95, 0.99, 1.0]
+    ordered = np.sort(latencies_us)
+    max_latency = ordered[-1] * 1e-6
+    for max_arg in (max_latency, None):
+        results = tester.percentiles(quantiles, max_arg)
+        for q, result in zip(quantiles, results):
+            exact = ordered[math.ceil(q * ordered.size) - 1] * 1e-6  # Nearest-rank percentile.
+            assert exact - 1e-9 <= result <= exact * (1 + 1 / 64) + 1e-6, f"P{q * 100:g} out of bounds"
+    assert tester.percentiles([1.0], max_latency)[0] == max_latency, "P100 should be capped at the maximum"
+
+def collect_deadlines(pattern, qps, duration, start=100.0):
+    """
+    Runs a request pattern against a stub tester and an unbounded queue, and returns the deadlines it produced.
+    """
+    tester = SimpleNamespace(qps=qps, duration=duration, end_time=start + duration)
+    queue = asyncio.Queue()
+    asyncio.run(pattern(tester, queue))
+    deadlines = []
+    while not queue.empty():
+        deadlines.append(queue.get_nowait())
+    return np.array(deadlines)
+
+def test_constant_rate_deadlines():
+    """
+    Test that the constant pattern spaces deadlines 1/qps apart over the whole duration.
+    """
+    deadlines = collect_deadlines(constant_rate_requests, qps=10, duration=5)
+    assert deadlines.size == 50
+    assert deadlines[0] == 100.0
+    assert np.allclose(np.diff(deadlines), 0.1)
+    assert deadlines[-1] < 105.0
+
+def test_spike_deadlines():
+    """
+    Test that the spike pattern sends at 1/qps spacing during 10s spikes and nothing during the 10s rests.
+    """
+    deadlines = collect_deadlines(spike_requests, qps=5, duration=35)
+    assert deadlines.size == 100  # Spikes at [0, 10) and [20, 30); the run ends during the second rest.
+    assert not np.any((deadlines >= 110.0) & (deadlines < 120.0)), "No deadlines should fall in the rest period"
+    first, second = deadlines[deadlines < 110.0], deadlines[deadlines >= 120.0]
+    assert first.size == second.size == 50
+    assert np.allclose(np.diff(first), 0.2) and np.allclose(np.diff(second), 0.2)
+    assert first[0] == 100.0 and second[0] == 120.0 and deadlines[-1] < 135.0
+
+def test_ramp_deadlines():
+    """
+    Test that the ramp pattern sends int(1 + k * ramp_rate) requests in second k, spread evenly across it.
+    """
+    deadlines = collect_deadlines(ramp_requests, qps=10, duration=5)
+    ramp_rate = (10 - 1) / 5
+    for second in range(5):
+        in_second = deadlines[(deadlines >= 100.0 + second) & (deadlines < 101.0 + second)]
+        expected = int(1 + second * ramp_rate)
+        assert in_second.size == expected
+        assert np.allclose(in_second, 100.0 + second + np.arange(expected) / expected)
+    assert deadlines.size == 1 + 2 + 4 + 6 + 8
+
+def test_worker_totals_and_stop_signal():
+    """
+    Test that workers send one request per deadline, add their request and error counts to the tester's totals,
+    and each stop on its own None signal.
+    """
+    tester = HTTPLoadTester({'url': 'http://localhost', 'concurrency': 2})
+    outcomes = iter([200, 200, asyncio.TimeoutError(), OSError("connection reset"), 500])
+
+    async def do_request(session):
+        await asyncio.sleep(0)
+        outcome = next(outcomes)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    tester._do_request = do_request  # Stub the HTTP request.
+
+    async def run_workers():
+        tester.start_time_ns = time.monotonic_ns()
+        queue = asyncio.Queue()
+        for _ in range(5):
+            queue.put_nowait(time.monotonic() - 1)  # Deadlines already due.
+        for _ in range(tester.concurrency):
+            queue.put_nowait(None)  # One stop signal per worker.
+        workers = [asyncio.create_task(tester._worker(None, queue)) for _ in range(tester.concurrency)]
+        await asyncio.wait_for(asyncio.gather(*workers), timeout=5)  # Hangs if a worker misses its stop signal.
+        return queue
+
+    queue = asyncio.run(run_workers())
+    assert queue.empty(), "Each worker should consume exactly one stop signal"
+    assert tester.total_requests == 5
+    assert tester.errors == 2, "The timeout and the connection error should be counted"
+    assert sorted(tester._status[:tester._n].tolist()) == [0, 0, 200, 200, 500]